@@ -4,6 +4,112 @@ from ccinput.constants import CalcType, ATOMIC_NUMBER, LOWERCASE_ATOMIC_SYMBOLS
 from ccinput.utilities import get_solvent, get_method
 from ccinput.exceptions import InvalidParameter, ImpossibleCalculation
 
+_ALLOWED_CHARS = frozenset("qwertyuiopasdfghjklzxcvbnm-1234567890./= ")
+# Maps "=" to a space and deletes every other character outside the whitelist
+_SPEC_CLEANUP_TABLE = str.maketrans(
+    "=", " ", "".join(chr(c) for c in range(128) if chr(c) not in _ALLOWED_CHARS)
+)
+
+_FLAG_ARGS = {
+    "nci": "nci ",
+    "quick": "quick ",
+    "squick": "squick ",
+    "mquick": "mquick ",
+}
+
+_METHOD_TOKENS = frozenset(["gfn2", "gfn1", "gfn0", "gfnff", "gfn2//gfnff"])
+
+_OPT_LEVELS = frozenset(
+    ["crude", "sloppy", "loose", "lax", "normal", "tight", "vtight", "extreme"]
+)
+
+_GFN_VERSIONS = frozenset(["0", "1", "2"])
+
+_CONF_TYPES = frozenset([CalcType.CONF_SEARCH, CalcType.CONSTR_CONF_SEARCH])
+
+
+def _coerce(value, typ, msg):
+    try:
+        return typ(value)
+    except (TypeError, ValueError):
+        raise InvalidParameter(msg)
+
+
+def _spec_method(xtb, state, token):
+    if token == "gfn2//gfnff" and not xtb._is_conf:
+        raise InvalidParameter(f"Invalid method for calculation type: {token}")
+    if token in ["gfn2", "gfn1", "gfn0"]:
+        state["method"] = f"{token[:-1]} {token[-1]}"
+    else:
+        state["method"] = token
+
+
+def _spec_opt(xtb, state, value):
+    if value not in _OPT_LEVELS:
+        raise InvalidParameter("Invalid optimization specification")
+    state["opt_level"] = value
+
+
+def _spec_rthr(xtb, state, value):
+    if not xtb._is_conf:
+        raise InvalidParameter("Invalid specification for calculation type: rthr")
+    _coerce(value, float, "Parameter rthr must be a floating point value")
+    state["rthr"] = value
+
+
+def _spec_ewin(xtb, state, value):
+    if not xtb._is_conf:
+        raise InvalidParameter("Invalid specification for calculation type: ewin")
+    _coerce(value, float, "Parameter ewin must be a floating point value")
+    state["ewin"] = value
+
+
+def _spec_acc(xtb, state, value):
+    state["accuracy"] = _coerce(
+        value, float, "Parameter acc must be a floating point value"
+    )
+
+
+def _spec_iterations(xtb, state, value):
+    state["iterations"] = _coerce(
+        value, int, "Invalid number of iterations: must be an integer"
+    )
+
+
+def _spec_force_constant(xtb, state, value):
+    xtb.force_constant = _coerce(
+        value, float, "Invalid force constant: must be a floating point value"
+    )
+
+
+def _spec_gfn(xtb, state, value):
+    if value not in _GFN_VERSIONS:
+        raise InvalidParameter("Invalid GFN version")
+    state["method"] = f"gfn {value}"
+
+
+_ARG_OPT = "--opt "
+_ARG_OPT_TIGHT = "--opt tight "
+_ARG_OHESS = "--ohess "
+_ARG_HESS = "--hess "
+_ARG_CINP = "-cinp "
+_ARG_INPUT = "--input "
+_ARG_GBSA = "-g "
+_ARG_ALPB = "alpb "
+_ARG_CHRG = "chrg "
+_ARG_UHF = "uhf "
+
+_KV_HANDLERS = {
+    "o": _spec_opt,
+    "opt": _spec_opt,
+    "rthr": _spec_rthr,
+    "ewin": _spec_ewin,
+    "acc": _spec_acc,
+    "iterations": _spec_iterations,
+    "forceconstant": _spec_force_constant,
+    "gfn": _spec_gfn,
+}
+
 
 class XtbCalculation:
     EXECUTABLES = {
@@ -19,10 +125,10 @@ class XtbCalculation:
 
     GFN_KEYWORDS = {
         "gfn2-xtb": "",
-        "gfn1-xtb": "--gfn 1 ",
-        "gfn0-xtb": "--gfn 0 ",
-        "gfn-ff": "--gfnff ",
-        "gfn2-xtb//gfn-ff": "--gfn2gfnff ",
+        "gfn1-xtb": "gfn 1 ",
+        "gfn0-xtb": "gfn 0 ",
+        "gfn-ff": "gfnff ",
+        "gfn2-xtb//gfn-ff": "gfn2gfnff ",
     }
 
     def __init__(self, calc):
@@ -31,14 +137,26 @@ class XtbCalculation:
         self.main_command = ""
         self.cmd_arguments = ""
         self.input_file = ""
+        self._input_file_parts = []
+        self._main_parts = []
+        self._cmd_parts = []
+        self._confirmed_parts = []
         self.specifications = ""
         self.force_constant = 1.0
         self.confirmed_specifications = ""
+        self._needs_opt = False
 
         if self.calc.type not in self.EXECUTABLES:
             raise ImpossibleCalculation(
                 f"xtb does not support calculations of type {self.calc.type}"
             )
+
+        self._is_conf = self.calc.type in _CONF_TYPES
+        # Crest 2.10.2 does not read arguments with double dashes
+        self._dash = "-" if self._is_conf else "--"
+
+        self._input_file_name = self.get_output_name()
+
         self.handle_command()
         self.handle_specifications()
 
@@ -51,6 +169,13 @@ class XtbCalculation:
 
         self.create_command()
 
+    def _append_cmd_argument(self, *frags):
+        # cmd_arguments follows the dash style of the executable, while
+        # confirmed_specifications keeps the canonical double-dash form so it
+        # can be parsed again as a specification string
+        self._cmd_parts.extend((self._dash,) + frags)
+        self._confirmed_parts.extend(("--",) + frags)
+
     def get_output_name(self):
         if self.calc.file:
             return os.path.basename(self.calc.file)
@@ -67,7 +192,7 @@ class XtbCalculation:
 
         method_keyword = self.GFN_KEYWORDS[method]
         if method_keyword != "":
-            self.main_command += method_keyword
+            self._main_parts.extend((self._dash, method_keyword))
 
         if self.calc.parameters.solvent != "":
             if (
@@ -84,234 +209,151 @@ class XtbCalculation:
                 raise InvalidParameter("Invalid solvent")
 
             if self.calc.parameters.solvation_model == "gbsa":
-                self.main_command += f"-g {solvent_keyword} "
+                self._main_parts.extend((_ARG_GBSA, solvent_keyword, " "))
             elif self.calc.parameters.solvation_model == "alpb":
-                self.main_command += f"--alpb {solvent_keyword} "
+                self._main_parts.extend((self._dash, _ARG_ALPB, solvent_keyword, " "))
             else:
                 raise InvalidParameter(
                     f"Invalid solvation method for xtb: {self.calc.parameters.solvation_model}"
                 )
 
         if self.calc.charge != 0:
-            self.main_command += f"--chrg {self.calc.charge} "
+            self._main_parts.extend((self._dash, _ARG_CHRG, str(self.calc.charge), " "))
 
         if self.calc.multiplicity != 1:
-            self.main_command += f"--uhf {self.calc.multiplicity} "
+            self._main_parts.extend(
+                (self._dash, _ARG_UHF, str(self.calc.multiplicity), " ")
+            )
 
     def handle_constraints_scan(self):
         if len(self.calc.constraints) == 0:
             raise InvalidParameter("No constraint in constrained optimisation mode")
 
-        self.input_file += "$constrain\n"
-        self.input_file += f"force constant={self.force_constant}\n"
-        self.has_scan = False
+        self._input_file_parts.append("$constrain\n")
+        self._input_file_parts.append(f"force constant={self.force_constant}\n")
 
-        for cmd in self.calc.constraints:
-            self.input_file += cmd.to_xtb()
+        scan_parts = []
+        for counter, cmd in enumerate(self.calc.constraints):
+            self._input_file_parts.append(cmd.to_xtb())
             if cmd.scan:
-                self.has_scan = True
+                scan_parts.append(
+                    f"{counter+1}: {cmd.start_d:.2f}, {cmd.end_d:.2f}, {cmd.num_steps}\n"
+                )
+
+        self.has_scan = len(scan_parts) > 0
 
         if self.has_scan:
-            self.input_file += "$scan\n"
-            for counter, cmd in enumerate(self.calc.constraints):
-                if cmd.scan:
-                    self.input_file += f"{counter+1}: {cmd.start_d:.2f}, {cmd.end_d:.2f}, {cmd.num_steps}\n"
+            self._input_file_parts.append("$scan\n")
+            self._input_file_parts.extend(scan_parts)
 
     def compress_indices(self, arr):
-        comp = []
-
-        def add_to_str(curr):
-            if len(curr) == 0:
-                return ""
-            elif len(curr) == 1:
-                return f"{curr[0]}"
+        parts = []
+        run_start = prev = None
+
+        for a in sorted({int(i) for i in arr}):
+            if run_start is None:
+                run_start = prev = a
+            elif a == prev + 1:
+                prev = a
             else:
-                return f"{curr[0]}-{curr[-1]}"
-
-        _arr = sorted(set(arr))
-        curr_atoms = []
+                parts.append(
+                    str(run_start) if run_start == prev else f"{run_start}-{prev}"
+                )
+                run_start = prev = a
 
-        for a in _arr:
-            if len(curr_atoms) == 0:
-                curr_atoms.append(a)
-            else:
-                if a == curr_atoms[-1] + 1:
-                    curr_atoms.append(a)
-                else:
-                    comp.append(add_to_str(curr_atoms))
-                    curr_atoms = [a]
+        if run_start is not None:
+            parts.append(str(run_start) if run_start == prev else f"{run_start}-{prev}")
 
-        comp.append(add_to_str(curr_atoms))
-        return ",".join(comp)
+        return ",".join(parts)
 
     def handle_constraints_crest(self):
         if len(self.calc.constraints) == 0:
             raise InvalidParameter("No constraint in constrained optimisation mode")
 
-        num_atoms = len(self.calc.xyz.split("\n"))
-
-        input_file_name = self.get_output_name()
+        num_atoms = self.calc.xyz.count("\n") + 1
 
-        self.input_file += "$constrain\n"
-        self.input_file += f"force constant={self.force_constant}\n"
-        self.input_file += f"reference={input_file_name}\n"
+        self._input_file_parts.append("$constrain\n")
+        self._input_file_parts.append(f"force constant={self.force_constant}\n")
+        self._input_file_parts.append(f"reference={self._input_file_name}\n")
         constr_atoms = []
         for cmd in self.calc.constraints:
-            self.input_file += cmd.to_xtb()
+            self._input_file_parts.append(cmd.to_xtb())
             constr_atoms += cmd.ids
 
-        self.input_file += f"atoms: {self.compress_indices(constr_atoms)}\n"
+        self._input_file_parts.append(f"atoms: {self.compress_indices(constr_atoms)}\n")
 
-        mtd_atoms = list(range(1, num_atoms))
-        for a in constr_atoms:
-            if int(a) in mtd_atoms:
-                mtd_atoms.remove(int(a))
+        constr_set = {int(a) for a in constr_atoms}
+        mtd_atoms = [i for i in range(1, num_atoms) if i not in constr_set]
 
-        self.input_file += "$metadyn\n"
-        self.input_file += f"atoms: {self.compress_indices(mtd_atoms)}\n"
+        self._input_file_parts.append("$metadyn\n")
+        self._input_file_parts.append(f"atoms: {self.compress_indices(mtd_atoms)}\n")
 
     def handle_specifications(self):
-        accuracy = -1
-        iterations = -1
-        method = "gfn2-xtb"
-        opt_level = "tight"
-        rthr = 2.0
-        ewin = 6
-        cmd_arguments = ""
-
-        ALLOWED = "qwertyuiopasdfghjklzxcvbnm-1234567890./= "
-        clean_specs = "".join(
-            [
-                i
-                for i in self.specifications
-                + self.calc.parameters.specifications.lower()
-                if i in ALLOWED
-            ]
-        )
-        clean_specs = clean_specs.replace("=", " ").replace("  ", " ")
-
-        specs = clean_specs.strip().split("--")
-
-        for spec in specs:
-            if spec.strip() == "":
-                continue
-            ss = spec.strip().split()
-            if len(ss) == 1:
-                if ss[0] in ["gfn2", "gfn1", "gfn0", "gfnff", "gfn2//gfnff"]:
-                    if ss[0] == "gfn2//gfnff" and self.calc.type not in [
-                        CalcType.CONF_SEARCH,
-                        CalcType.CONSTR_CONF_SEARCH,
-                    ]:
-                        raise InvalidParameter(
-                            f"Invalid method for calculation type: {ss[0]}"
-                        )
-                    if ss[0] in ["gfn2", "gfn1", "gfn0"]:
-                        method = f"{ss[0][:-1]} {ss[0][-1]}"
-                    else:
-                        method = ss[0]
-                elif ss[0] == "nci":
-                    self.cmd_arguments += "--nci "
-                elif ss[0] == "quick":
-                    self.cmd_arguments += "--quick "
-                elif ss[0] == "squick":
-                    self.cmd_arguments += "--squick "
-                elif ss[0] == "mquick":
-                    self.cmd_arguments += "--mquick "
-                else:
-                    raise InvalidParameter("Invalid specification")
-            elif len(ss) == 2:
-                if ss[0] == "o" or ss[0] == "opt":
-                    if ss[1] not in [
-                        "crude",
-                        "sloppy",
-                        "loose",
-                        "lax",
-                        "normal",
-                        "tight",
-                        "vtight",
-                        "extreme",
-                    ]:
-                        raise InvalidParameter("Invalid optimization specification")
-                    opt_level = ss[1]
-                elif ss[0] == "rthr":
-                    if self.calc.type not in [
-                        CalcType.CONF_SEARCH,
-                        CalcType.CONSTR_CONF_SEARCH,
-                    ]:
-                        raise InvalidParameter(
-                            "Invalid specification for calculation type: rthr"
-                        )
-                    try:
-                        float(ss[1])
-                    except ValueError:
-                        raise InvalidParameter(
-                            "Parameter rthr must be a floating point value"
-                        )
-                    else:
-                        rthr = ss[1]
-
-                elif ss[0] == "ewin":
-                    if self.calc.type not in [
-                        CalcType.CONF_SEARCH,
-                        CalcType.CONSTR_CONF_SEARCH,
-                    ]:
-                        raise InvalidParameter(
-                            "Invalid specification for calculation type: ewin"
-                        )
-                    try:
-                        float(ss[1])
-                    except ValueError:
-                        raise InvalidParameter(
-                            "Parameter ewin must be a floating point value"
-                        )
+        state = {
+            "accuracy": -1,
+            "iterations": -1,
+            "method": "gfn2-xtb",
+            "opt_level": "tight",
+            "rthr": 2.0,
+            "ewin": 6,
+        }
+
+        # Parsing "--opt tight" only reproduces the defaults, so the common case
+        # of no user specifications can skip the tokenization entirely
+        if self.calc.parameters.specifications != "" or self.specifications not in (
+            "",
+            _ARG_OPT_TIGHT,
+        ):
+            clean_specs = (
+                self.specifications + self.calc.parameters.specifications.lower()
+            ).translate(_SPEC_CLEANUP_TABLE)
+
+            specs = " ".join(clean_specs.split()).split("--")
+
+            for spec in specs:
+                if spec.strip() == "":
+                    continue
+                ss = spec.strip().split()
+                if len(ss) == 1:
+                    if ss[0] in _METHOD_TOKENS:
+                        _spec_method(self, state, ss[0])
+                    elif ss[0] in _FLAG_ARGS:
+                        self._append_cmd_argument(_FLAG_ARGS[ss[0]])
                     else:
-                        ewin = ss[1]
-                elif ss[0] == "acc":
-                    accuracy = float(ss[1])
-                elif ss[0] == "iterations":
-                    try:
-                        iterations = int(ss[1])
-                    except ValueError:
-                        raise InvalidParameter(
-                            "Invalid number of iterations: must be an integer"
-                        )
-                elif ss[0] == "forceconstant":
-                    try:
-                        self.force_constant = float(ss[1])
-                    except ValueError:
-                        raise InvalidParameter(
-                            "Invalid force constant: must be a floating point value"
-                        )
-                elif ss[0] == "gfn":
-                    if ss[1] not in ["0", "1", "2"]:
-                        raise InvalidParameter("Invalid GFN version")
-                    method = f"{ss[0]} {ss[1]}"
+                        raise InvalidParameter("Invalid specification")
+                elif len(ss) == 2:
+                    handler = _KV_HANDLERS.get(ss[0])
+                    if handler is None:
+                        raise InvalidParameter(f"Unknown specification: {ss[0]}")
+                    handler(self, state, ss[1])
                 else:
-                    raise InvalidParameter(f"Unknown specification: {ss[0]}")
-            else:
-                raise InvalidParameter(f"Invalid specification: {ss}")
+                    raise InvalidParameter(f"Invalid specification: {ss}")
+
+        accuracy = state["accuracy"]
+        iterations = state["iterations"]
+        method = state["method"]
+        opt_level = state["opt_level"]
+        rthr = state["rthr"]
+        ewin = state["ewin"]
 
         if accuracy != -1:
-            self.cmd_arguments += f"--acc {accuracy:.2f} "
+            self._append_cmd_argument(f"acc {accuracy:.2f} ")
         if iterations != -1:
-            self.cmd_arguments += f"--iterations {iterations} "
+            self._append_cmd_argument("iterations ", str(iterations), " ")
         if method != "gfn2-xtb" and method != "gfn 2":
-            self.cmd_arguments += f"--{method} "
+            self._append_cmd_argument(method, " ")
         if opt_level != "normal":
-            self.main_command = self.main_command.replace(
-                "--opt ", f"--opt {opt_level} "
-            )
+            if self._needs_opt:
+                self._main_parts.insert(0, f"--opt {opt_level} ")
             self.confirmed_specifications += f"--opt {opt_level} "
+        elif self._needs_opt:
+            self._main_parts.insert(0, _ARG_OPT)
 
-        if self.calc.type in [CalcType.CONF_SEARCH, CalcType.CONSTR_CONF_SEARCH]:
-            self.cmd_arguments += f"--rthr {rthr} --ewin {ewin}"
-            self.confirmed_specifications += self.cmd_arguments.strip()
+        if self._is_conf:
+            self._append_cmd_argument("rthr ", str(rthr), " ")
+            self._append_cmd_argument("ewin ", str(ewin))
 
-            self.cmd_arguments = self.cmd_arguments.replace(
-                "--", "-"
-            )  # Crest 2.10.2 does not read arguments with double dashes
-        else:
-            self.confirmed_specifications += self.cmd_arguments.strip()
+        self.confirmed_specifications += "".join(self._confirmed_parts).strip()
 
     def handle_command(self):
         self.program = self.EXECUTABLES[self.calc.type]
@@ -322,24 +364,25 @@ class XtbCalculation:
             aux_input = "input"
 
         if self.calc.type == CalcType.OPT:
-            self.specifications = "--opt tight "
-            self.main_command += "--opt "
+            self.specifications = _ARG_OPT_TIGHT
+            self._needs_opt = True
         elif self.calc.type == CalcType.OPTFREQ:
-            self.main_command = "--ohess "  # Not sure if the tightness will be parsed
+            # Not sure if the tightness will be parsed
+            self._main_parts.append(_ARG_OHESS)
         elif self.calc.type == CalcType.CONSTR_CONF_SEARCH:
-            self.main_command += f"-cinp {aux_input} "
+            self._main_parts.extend((_ARG_CINP, aux_input, " "))
         elif self.calc.type == CalcType.CONSTR_OPT:
-            self.main_command += f"--opt --input {aux_input} "
+            self._needs_opt = True
+            self._main_parts.extend((_ARG_INPUT, aux_input, " "))
         elif self.calc.type == CalcType.FREQ:
-            self.main_command += "--hess "
+            self._main_parts.append(_ARG_HESS)
 
     def create_command(self):
-        input_file_name = self.get_output_name()
+        input_file_name = self._input_file_name
 
-        if self.calc.type in [CalcType.CONF_SEARCH, CalcType.CONSTR_CONF_SEARCH]:
-            self.main_command = self.main_command.replace(
-                "--", "-"
-            )  # Crest 2.10.2 does not read arguments with double dashes
+        self.input_file = "".join(self._input_file_parts)
+        self.main_command = "".join(self._main_parts)
+        self.cmd_arguments = "".join(self._cmd_parts)
 
         if self.main_command != "":
             self.command = f"{self.program} {input_file_name} {self.main_command.strip()} {self.cmd_arguments}".strip()
@@ -398,6 +398,24 @@ class XtbTests(InputTests):
 
         self.assertEqual("", xtb.input_file)
 
+    def test_conformational_search_confirmed_specifications(self):
+        params = {
+            "type": "Conformational Search",
+            "file": "ethanol.xyz",
+            "software": "xtb",
+        }
+
+        xtb = self.generate_calculation(**params)
+
+        self.assertEqual(
+            xtb.confirmed_specifications.strip(), "--opt tight --rthr 2.0 --ewin 6"
+        )
+
+        params["specifications"] = xtb.confirmed_specifications
+        xtb2 = self.generate_calculation(**params)
+
+        self.assertEqual(xtb.command, xtb2.command)
+
     def test_constrained_conformational_search1(self):
         params = {
             "type": "Constrained Conformational Search",
@@ -622,6 +640,17 @@ class XtbTests(InputTests):
         with self.assertRaises(InvalidParameter):
             xtb = self.generate_calculation(**params)
 
+    def test_invalid_specification_acc(self):
+        params = {
+            "type": "Single-Point Energy",
+            "file": "ethanol.xyz",
+            "software": "xtb",
+            "specifications": "--acc abc",
+        }
+
+        with self.assertRaises(InvalidParameter):
+            xtb = self.generate_calculation(**params)
+
     def test_invalid_specification_for_type1(self):
         params = {
             "type": "Geometrical Optimisation",
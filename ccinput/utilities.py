@@ -1,5 +1,7 @@
 import os
 import string
+from functools import lru_cache
+
 import numpy as np
 
 from ccinput.constants import *
@@ -300,6 +302,7 @@ def get_basis_set(basis_set, software):
         return BASIS_SET_EXCHANGE_KEY[abs_basis_set]
 
 
+@lru_cache(maxsize=256)
 def get_solvent(solvent, software, solvation_model="smd"):
     try:
         abs_solvent = get_abs_solvent(solvent)